@@ -1,24 +1,33 @@
 
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, File, UploadFile
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import func, case, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from typing import List, Optional
+from functools import lru_cache
 import io
-import qrcode
+import os
+import time
 import hashlib
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime
 import jwt
-from passlib.context import CryptContext
+import orjson
+import cachetools
+import bcrypt
 
 # Importações dos nossos módulos (criaremos depois)
-from database import get_db, engine
+from database import get_db, engine, SessionLocal, init_db
 import models
 import schemas
 
-# Criar todas as tabelas no banco de dados
-models.Base.metadata.create_all(bind=engine)
+# As tabelas são criadas no evento de startup (init_db) - com o
+# engine async não dá para rodar DDL durante o import do módulo
 
 # ==============================================================================
 # CONFIGURAÇÕES DA API
@@ -29,7 +38,10 @@ app = FastAPI(
     description="API para gerenciamento de materiais com QR Code",
     version="1.0.0",
     docs_url="/docs",  # Swagger UI
-    redoc_url="/redoc"  # ReDoc
+    redoc_url="/redoc",  # ReDoc
+    # orjson serializa JSON ~5x mais rápido que o json da stdlib
+    # (com datetime nativo) - ganho direto nas listagens grandes
+    default_response_class=ORJSONResponse
 )
 
 # CORS - Permitir que o frontend React acesse a API
@@ -51,31 +63,81 @@ SECRET_KEY = "sua-chave-secreta-super-segura-aqui-123456"  # MUDE ISSO!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 horas
 
-# Context para hash de senhas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Custo do bcrypt (mesmo fator que o passlib usava por padrão)
+BCRYPT_ROUNDS = 12
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Assinador JWS reusado entre logins: jwt.encode() reconstrói o
+# header e re-resolve o algoritmo a cada chamada; com a instância
+# cacheada e a chave já em bytes, sobra só a assinatura HMAC em si.
+# A VALIDAÇÃO continua via jwt.decode (que confere exp/assinatura)
+_JWS = jwt.PyJWS(algorithms=[ALGORITHM])
+_SIGNING_KEY = SECRET_KEY.encode()
+
 # ==============================================================================
 # FUNÇÕES AUXILIARES DE AUTENTICAÇÃO
 # ==============================================================================
 
 def verify_password(plain_password, hashed_password):
-    """Verifica se a senha está correta"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """
+    Verifica se a senha está correta
+
+    Usa o bcrypt direto: o custo computacional (proposital) continua
+    no bcrypt em si, mas sem as camadas de detecção de scheme e
+    marshaling do passlib em cada chamada
+    """
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 def get_password_hash(password):
-    """Gera hash da senha"""
-    return pwd_context.hash(password)
+    """Gera hash da senha (bcrypt, mesmo fator de custo de antes)"""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 def create_access_token(data: dict):
-    """Cria token JWT"""
+    """Cria token JWT (payload serializado com orjson, assinador cacheado)"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    # exp como timestamp inteiro (formato que o jwt.decode valida)
+    to_encode["exp"] = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    return _JWS.encode(orjson.dumps(to_encode), _SIGNING_KEY, algorithm=ALGORITHM)
+
+# Cache de usuários autenticados (TTL de 60 segundos)
+# Quase toda rota depende de get_current_user, que buscava o MESMO
+# usuário no banco a cada request. Com o cache, só vamos ao banco
+# no primeiro request de cada usuário (ou a cada 60s)
+_user_cache = cachetools.TTLCache(maxsize=1024, ttl=60)
+
+def invalidate_user(username: str):
+    """
+    Remove um usuário do cache de autenticação
+
+    Chame após qualquer mutação de usuário (troca de senha,
+    mudança de role, desativação) para o cache não servir
+    dados antigos durante o TTL
+    """
+    _user_cache.pop(username, None)
+
+def get_current_principal(token: str = Depends(oauth2_scheme)) -> dict:
+    """
+    Obtém as claims do token JWT SEM consultar o banco
+
+    O token já carrega sub (username), role e uid, então rotas que
+    só precisam saber "quem é" e "qual o papel" não pagam um SELECT
+    por request. Use get_current_user apenas quando a rota precisar
+    do objeto ORM completo (ex: /users/me)
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Credenciais inválidas",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """Obtém usuário atual do token JWT"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -89,40 +151,105 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+    # Tenta o cache antes do banco (elimina 1 SELECT por request)
+    user = _user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = await db.scalar(
+            select(models.User).where(models.User.username == username)
+        )
+        if user is None:
+            raise credentials_exception
+        _user_cache[username] = user
     return user
 
+# Chave do BLAKE2b para o hash do QR Code (identificador opaco,
+# não é segredo criptográfico crítico)
+_QR_HASH_KEY = os.getenv("QR_KEY", "qr").encode()
+
+# Template reusável do QRCode (criado lazy na primeira renderização)
+_qr_template = None
+_qr_lock = threading.Lock()
+
 def generate_qr_hash(material_id: int, nome: str) -> str:
-    """Gera hash único para QR Code baseado no ID e nome do material"""
-    data = f"{material_id}-{nome}-{datetime.utcnow().timestamp()}"
-    return hashlib.sha256(data.encode()).hexdigest()[:16]
+    """
+    Gera hash único para QR Code baseado no ID e nome do material
+
+    Usa BLAKE2b com digest de 8 bytes (16 chars hex) em vez de
+    SHA-256 truncado: mais rápido por chamada no CPython e já sai
+    no tamanho certo, sem gerar 64 chars para jogar 48 fora
+    """
+    data = f"{material_id}-{nome}-{time.time_ns()}"
+    return hashlib.blake2b(data.encode(), digest_size=8, key=_QR_HASH_KEY).hexdigest()
+
+@lru_cache(maxsize=4096)
+def _render_qr(qr_hash: str) -> bytes:
+    """
+    Renderiza o PNG do QR Code para um hash
+
+    A renderização (Reed-Solomon + rasterização PIL) é puro CPU e
+    determinística a partir do qr_hash, que é imutável. Por isso o
+    resultado é memoizado: cada hash só é renderizado UMA vez por
+    processo (e materiais novos já guardam o PNG na coluna qr_png)
+
+    O import do qrcode é feito aqui dentro (lazy): a lib puxa o PIL
+    inteiro, e workers que nunca renderizam QR Code (ex: instâncias
+    só de conferência) não pagam esse custo de cold-start nem de RSS.
+    O CPython cacheia o módulo, então depois da primeira chamada o
+    import é só um lookup em sys.modules
+
+    O objeto QRCode é criado UMA vez e reusado entre chamadas
+    (clear() + add_data()), evitando realocar as tabelas do encoder
+    Reed-Solomon a cada render. O lock protege o template, já que o
+    FastAPI pode chamar isto de threads/tasks concorrentes
+    """
+    global _qr_template
+    import qrcode
+
+    with _qr_lock:
+        if _qr_template is None:
+            _qr_template = qrcode.QRCode(version=1, box_size=10, border=5)
+        qr = _qr_template
+        qr.clear()
+        qr.version = 1  # clear() não reseta a versão ajustada pelo fit
+        qr.add_data(qr_hash)
+        qr.make(fit=True)
+
+        img = qr.make_image(fill_color="black", back_color="white")
+
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
 
 # ==============================================================================
 # ROTAS DE AUTENTICAÇÃO
 # ==============================================================================
 
 @app.post("/token", tags=["Autenticação"])
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     Login do usuário
-    
+
     Credenciais padrão:
     - username: admin
     - password: 123456
     """
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(
+        select(models.User).where(models.User.username == form_data.username)
+    )
+
+    # bcrypt é CPU pesado de propósito: roda no threadpool para
+    # não travar o event loop durante a verificação
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuário ou senha incorretos",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(data={"sub": user.username})
+    # role e uid vão nas claims: rotas protegidas que só precisam
+    # de autenticação/autorização decodificam o token sem ir ao banco
+    access_token = create_access_token(data={"sub": user.username, "role": user.role, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer", "role": user.role}
 
 @app.get("/users/me", response_model=schemas.User, tags=["Autenticação"])
@@ -137,8 +264,8 @@ async def read_users_me(current_user: models.User = Depends(get_current_user)):
 @app.post("/materiais", response_model=schemas.Material, tags=["Materiais"])
 async def criar_material(
     material: schemas.MaterialCreate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Cria um novo material e gera QR Code automaticamente
@@ -151,53 +278,138 @@ async def criar_material(
     - responsavel: Nome do responsável
     """
     # Criar material no banco
-    db_material = models.Material(**material.dict())
+    db_material = models.Material(**material.model_dump())
     db.add(db_material)
-    db.flush()  # Para obter o ID antes do commit
-    
+    await db.flush()  # Para obter o ID antes do commit
+
     # Gerar hash único para QR Code
     db_material.qr_hash = generate_qr_hash(db_material.id, db_material.nome)
-    
-    db.commit()
-    db.refresh(db_material)
+
+    # Renderizar o PNG do QR Code UMA vez e guardar na linha
+    # (o endpoint de QR Code passa a só ler bytes prontos)
+    db_material.qr_png = _render_qr(db_material.qr_hash)
+
+    await db.commit()
+    await db.refresh(db_material)
     return db_material
 
-@app.get("/materiais", response_model=List[schemas.Material], tags=["Materiais"])
+# Colunas que as telas de listagem realmente usam: evita trafegar
+# observacoes (Text), qr_png (bytes) e timestamps em cada linha
+_LIST_COLS = load_only(
+    models.Material.id,
+    models.Material.nome,
+    models.Material.bmp,
+    models.Material.setor,
+    models.Material.sala,
+    models.Material.responsavel,
+    models.Material.conferido,
+)
+
+@app.get("/materiais", response_model=List[schemas.MaterialListItem], tags=["Materiais"])
 async def listar_materiais(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     setor: Optional[str] = None,
     sala: Optional[str] = None,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Lista todos os materiais com filtros opcionais
-    
+
     Parâmetros:
     - skip: Número de registros para pular (paginação)
     - limit: Número máximo de registros a retornar
     - setor: Filtrar por setor específico
     - sala: Filtrar por sala específica
+
+    Suporta cache condicional: a resposta leva um ETag barato
+    (count + timestamps máximos) e If-None-Match devolve 304 sem
+    hidratar linhas nem serializar JSON
     """
-    query = db.query(models.Material)
-    
+    filtros = []
     if setor:
-        query = query.filter(models.Material.setor == setor)
+        filtros.append(models.Material.setor == setor)
     if sala:
-        query = query.filter(models.Material.sala == sala)
-    
-    materiais = query.offset(skip).limit(limit).all()
-    return materiais
+        filtros.append(models.Material.sala == sala)
+
+    # ETag barato: 1 query de agregação (count + max dos timestamps)
+    # é muito mais leve que hidratar e serializar a lista inteira
+    fingerprint = (await db.execute(
+        select(
+            func.count(models.Material.id),
+            func.max(models.Material.created_at),
+            func.max(models.Material.updated_at),
+        ).where(*filtros)
+    )).one()
+    etag = 'W/"%s"' % hashlib.blake2b(
+        f"{fingerprint}-{skip}-{limit}".encode(), digest_size=8
+    ).hexdigest()
+
+    if request.headers.get("if-none-match") == etag:
+        # Cliente já tem essa versão: 304 sem corpo
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    query = select(models.Material).options(_LIST_COLS).where(*filtros)
+    materiais = (await db.execute(query.offset(skip).limit(limit))).scalars().all()
+    # Valida e serializa a lista INTEIRA em duas chamadas ao
+    # pydantic-core (loop em Rust), em vez de um model_validate por
+    # linha + jsonable_encoder do FastAPI. Retornar Response pronto
+    # pula a revalidação do response_model (que fica só para a doc)
+    payload = schemas.MATERIAL_LIST_ADAPTER.dump_json(
+        schemas.MATERIAL_LIST_ADAPTER.validate_python(materiais, from_attributes=True)
+    )
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag})
+
+@app.get("/materiais/export", tags=["Materiais"])
+async def exportar_materiais(
+    current_user: dict = Depends(get_current_principal),
+):
+    """
+    Exporta TODOS os materiais em NDJSON (um JSON por linha)
+
+    Diferente de /materiais (paginado), aqui não há limit: o
+    resultado é transmitido em streaming com yield_per, então nem o
+    servidor materializa todas as linhas em memória, nem o cliente
+    precisa esperar a última linha para começar a processar
+    """
+    async def gen():
+        # A sessão é do PRÓPRIO generator, não do Depends(get_db): no
+        # FastAPI 0.109 pinado, o teardown das dependências yield roda
+        # ANTES do corpo da resposta ser gerado, o que fecharia a
+        # conexão embaixo do cursor server-side aberto pelo stream
+        db = SessionLocal()
+        try:
+            # yield_per busca do banco em lotes de 500 linhas
+            result = await db.stream(
+                select(models.Material).execution_options(yield_per=500)
+            )
+            # partitions(500): cada lote inteiro é validado em UMA
+            # chamada ao pydantic-core (loop ORM->schema em Rust) e
+            # vira UM chunk NDJSON — em vez de montar dict +
+            # json.dumps linha a linha e mandar um send ASGI por linha
+            async for batch in result.scalars().partitions(500):
+                items = schemas.MATERIAL_EXPORT_LIST_ADAPTER.validate_python(
+                    batch, from_attributes=True
+                )
+                yield "\n".join(m.model_dump_json() for m in items) + "\n"
+        finally:
+            await SessionLocal.remove()
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
 
 @app.get("/materiais/{material_id}", response_model=schemas.Material, tags=["Materiais"])
 async def obter_material(
     material_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Obtém um material específico por ID"""
-    material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    material = await db.scalar(
+        select(models.Material).where(models.Material.id == material_id)
+    )
     if not material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
     return material
@@ -206,44 +418,50 @@ async def obter_material(
 async def atualizar_material(
     material_id: int,
     material: schemas.MaterialUpdate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Atualiza informações de um material
     
     Permite alterar: setor, sala, responsável, BMP
     """
-    db_material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    db_material = await db.scalar(
+        select(models.Material).where(models.Material.id == material_id)
+    )
     if not db_material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
     
     # Atualizar apenas campos fornecidos
-    for key, value in material.dict(exclude_unset=True).items():
+    for key, value in material.model_dump(exclude_unset=True).items():
         setattr(db_material, key, value)
     
-    db.commit()
-    db.refresh(db_material)
+    await db.commit()
+    await db.refresh(db_material)
     return db_material
 
 @app.delete("/materiais/{material_id}", tags=["Materiais"])
 async def deletar_material(
     material_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Deleta um material (apenas para admin)
+
+    O papel vem direto da claim "role" do token (sem SELECT)
     """
-    if current_user.role != "admin":
+    if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Apenas administradores podem deletar materiais")
     
-    db_material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    db_material = await db.scalar(
+        select(models.Material).where(models.Material.id == material_id)
+    )
     if not db_material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
     
-    db.delete(db_material)
-    db.commit()
+    await db.delete(db_material)
+    await db.commit()
     return {"message": "Material deletado com sucesso"}
 
 # ==============================================================================
@@ -253,124 +471,188 @@ async def deletar_material(
 @app.get("/materiais/{material_id}/qrcode", tags=["QR Code"])
 async def gerar_qrcode(
     material_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Gera imagem PNG do QR Code para um material específico
-    
-    O QR Code contém o hash único do material
+    Retorna a imagem PNG do QR Code para um material específico
+
+    O QR Code contém o hash único do material. O PNG é gerado uma
+    única vez (na criação do material, ou na primeira leitura para
+    materiais antigos) e depois servido direto dos bytes cacheados
     """
-    material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    material = await db.scalar(
+        select(models.Material).where(models.Material.id == material_id)
+    )
     if not material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
-    
-    # Gerar QR Code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(material.qr_hash)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Converter para bytes
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    img_byte_arr.seek(0)
-    
-    return StreamingResponse(img_byte_arr, media_type="image/png")
+
+    # qr_hash é imutável, então serve de ETag direto: se o cliente
+    # já tem a imagem, devolve 304 sem tocar nos bytes do PNG
+    etag = f'W/"{material.qr_hash}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    # PNG pré-renderizado na criação; fallback para materiais
+    # criados antes da coluna qr_png existir
+    png_bytes = material.qr_png or _render_qr(material.qr_hash)
+
+    # Response simples em vez de StreamingResponse: o PNG já está
+    # inteiro em memória (<2KB), então streaming só adicionaria
+    # overhead de chunked-encoding e do iterador async
+    return Response(
+        content=png_bytes,
+        media_type="image/png",
+        headers=cache_headers
+    )
 
 @app.post("/conferencia/scan", tags=["Conferência"])
 async def scan_qrcode(
     scan_data: schemas.ScanQRCode,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Registra leitura de QR Code durante conferência
-    
+
     Atualiza localização do material se necessário
+
+    Busca + atualização + releitura viram UM único
+    UPDATE ... RETURNING: uma ida ao banco em vez de quatro
+    (SELECT, UPDATE, COMMIT, SELECT do refresh)
     """
-    # Buscar material pelo hash do QR Code
-    material = db.query(models.Material).filter(models.Material.qr_hash == scan_data.qr_hash).first()
+    stmt = (
+        update(models.Material)
+        .where(models.Material.qr_hash == scan_data.qr_hash)
+        .values(
+            setor=scan_data.setor,
+            sala=scan_data.sala,
+            ultima_conferencia=func.now(),
+            conferido=True,
+        )
+        .returning(models.Material)
+    )
+    material = (await db.execute(stmt)).scalar_one_or_none()
     if not material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
-    
-    # Atualizar localização onde foi lido
-    material.setor = scan_data.setor
-    material.sala = scan_data.sala
-    material.ultima_conferencia = datetime.utcnow()
-    material.conferido = True
-    
-    db.commit()
-    db.refresh(material)
-    
+
+    await db.commit()
+
     return {
         "message": "Conferência registrada com sucesso",
-        "material": material
+        # Serializa via schema (o objeto ORM carrega qr_png binário,
+        # que não pode ir no JSON). from_orm_fast: dado vem do banco,
+        # já validado na escrita — sem revalidação
+        "material": schemas.Material.from_orm_fast(material)
     }
 
 # ==============================================================================
 # ROTAS DE SETORES/SALAS
 # ==============================================================================
 
+# Cache curto para listas de setores/salas
+# Esses valores mudam raramente (cadastro de material novo), então
+# 30 segundos de TTL elimina quase todos os SELECTs repetidos
+_locais_cache = cachetools.TTLCache(maxsize=64, ttl=30)
+
 @app.get("/setores", tags=["Setores"])
 async def listar_setores(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Lista todos os setores únicos cadastrados"""
-    setores = db.query(models.Material.setor).distinct().all()
-    return [s[0] for s in setores if s[0]]
+    setores = _locais_cache.get("setores")
+    if setores is None:
+        # select() + scalars() devolve strings direto, sem construir
+        # objetos ORM por linha; o DISTINCT usa o índice de setor
+        setores = (await db.execute(
+            select(models.Material.setor)
+            .where(models.Material.setor.isnot(None))
+            .distinct()
+        )).scalars().all()
+        _locais_cache["setores"] = setores
+    return setores
 
 @app.get("/setores/{setor}/salas", tags=["Setores"])
 async def listar_salas_por_setor(
     setor: str,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Lista todas as salas de um setor específico"""
-    salas = db.query(models.Material.sala).filter(
-        models.Material.setor == setor
-    ).distinct().all()
-    return [s[0] for s in salas if s[0]]
-
-@app.get("/setores/{setor}/salas/{sala}/materiais", response_model=List[schemas.Material], tags=["Setores"])
+    cache_key = ("salas", setor)
+    salas = _locais_cache.get(cache_key)
+    if salas is None:
+        salas = (await db.execute(
+            select(models.Material.sala)
+            .where(
+                models.Material.setor == setor,
+                models.Material.sala.isnot(None),
+            )
+            .distinct()
+        )).scalars().all()
+        _locais_cache[cache_key] = salas
+    return salas
+
+@app.get("/setores/{setor}/salas/{sala}/materiais", response_model=List[schemas.MaterialListItem], tags=["Setores"])
 async def listar_materiais_por_local(
     setor: str,
     sala: str,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Lista todos os materiais de um setor e sala específicos"""
-    materiais = db.query(models.Material).filter(
-        models.Material.setor == setor,
-        models.Material.sala == sala
-    ).all()
-    return materiais
+    materiais = (await db.execute(
+        select(models.Material).options(_LIST_COLS).where(
+            models.Material.setor == setor,
+            models.Material.sala == sala,
+        )
+    )).scalars().all()
+    # Mesma técnica de /materiais: lote único no pydantic-core
+    payload = schemas.MATERIAL_LIST_ADAPTER.dump_json(
+        schemas.MATERIAL_LIST_ADAPTER.validate_python(materiais, from_attributes=True)
+    )
+    return Response(content=payload, media_type="application/json")
 
 # ==============================================================================
 # ROTAS DE DASHBOARD/ESTATÍSTICAS
 # ==============================================================================
 
-@app.get("/dashboard/stats", tags=["Dashboard"])
+@app.get("/dashboard/stats", response_model=schemas.DashboardStats, tags=["Dashboard"])
 async def obter_estatisticas(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retorna estatísticas gerais do sistema
+
+    Os três contadores saem em UMA única query (um round-trip,
+    um scan da tabela) em vez de três queries separadas
     """
-    total_materiais = db.query(models.Material).count()
-    materiais_conferidos = db.query(models.Material).filter(models.Material.conferido == True).count()
-    total_setores = db.query(models.Material.setor).distinct().count()
-    
-    return {
-        "total_materiais": total_materiais,
-        "materiais_conferidos": materiais_conferidos,
-        "materiais_nao_conferidos": total_materiais - materiais_conferidos,
-        "total_setores": total_setores,
-        "taxa_conferencia": round((materiais_conferidos / total_materiais * 100) if total_materiais > 0 else 0, 2)
-    }
+    total_materiais, materiais_conferidos, total_setores = (await db.execute(
+        select(
+            func.count(models.Material.id),
+            func.count(case((models.Material.conferido == True, 1))),
+            func.count(func.distinct(models.Material.setor)),
+        )
+    )).one()
+
+    stats = schemas.DashboardStats(
+        total_materiais=total_materiais,
+        materiais_conferidos=materiais_conferidos,
+        materiais_nao_conferidos=total_materiais - materiais_conferidos,
+        total_setores=total_setores,
+        taxa_conferencia=round((materiais_conferidos / total_materiais * 100) if total_materiais > 0 else 0, 2),
+    )
+    # STATS_ADAPTER emite os bytes direto do serializador Rust do
+    # pydantic-core; retornar Response pronto evita o jsonable_encoder
+    # e a revalidação do response_model (mantido só para a doc)
+    return Response(content=schemas.STATS_ADAPTER.dump_json(stats), media_type="application/json")
 
 # ==============================================================================
 # ROTA DE HEALTH CHECK
@@ -407,23 +689,34 @@ async def root():
 
 @app.on_event("startup")
 async def startup_event():
-    """Cria usuário admin padrão se não existir"""
-    db = next(get_db())
-    
-    # Verificar se admin já existe
-    admin = db.query(models.User).filter(models.User.username == "admin").first()
-    
-    if not admin:
-        # Criar admin padrão
-        admin_user = models.User(
-            username="admin",
-            hashed_password=get_password_hash("123456"),
-            role="admin"
+    """Cria as tabelas e o usuário admin padrão se não existir"""
+    # Criar todas as tabelas no banco de dados
+    await init_db()
+
+    db = SessionLocal()
+    try:
+        # SELECT 1 barato primeiro: em restart de ambiente já semeado
+        # (o caso comum) nem o hash bcrypt (caro!) é calculado
+        exists = await db.scalar(
+            select(models.User.id).where(models.User.username == "admin").limit(1)
         )
-        db.add(admin_user)
-        db.commit()
-        print("✅ Usuário admin criado com sucesso!")
-        print("   Username: admin")
-        print("   Password: 123456")
-    
-    db.close()
\ No newline at end of file
+
+        if exists is None:
+            # INSERT ... ON CONFLICT DO NOTHING: idempotente e seguro
+            # contra corrida quando vários workers sobem juntos
+            # (cada worker roda este startup ao mesmo tempo)
+            await db.execute(
+                pg_insert(models.User)
+                .values(
+                    username="admin",
+                    hashed_password=get_password_hash("123456"),
+                    role="admin",
+                )
+                .on_conflict_do_nothing(index_elements=["username"])
+            )
+            await db.commit()
+            print("✅ Usuário admin criado com sucesso!")
+            print("   Username: admin")
+            print("   Password: 123456")
+    finally:
+        await SessionLocal.remove()
\ No newline at end of file
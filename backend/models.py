@@ -9,7 +9,7 @@ Por que usar ORM?
 - Type checking
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, LargeBinary, Index, text
 from sqlalchemy.sql import func
 from database import Base
 
@@ -56,6 +56,7 @@ class Material(Base):
     - sala: Sala onde o material está localizado
     - responsavel: Nome do responsável pelo material
     - qr_hash: Hash único gerado para o QR Code (16 caracteres)
+    - qr_png: Bytes do PNG do QR Code (renderizado uma vez na criação)
     - conferido: Se o material foi conferido (True/False)
     - ultima_conferencia: Data/hora da última conferência
     - created_at: Data de criação do registro
@@ -67,7 +68,21 @@ class Material(Base):
     - timestamps: Auditoria e rastreamento de mudanças
     """
     __tablename__ = "materiais"
-    
+
+    __table_args__ = (
+        # Índice composto para o caminho de filtro mais comum:
+        # WHERE setor = ? AND sala = ? (listagens por local)
+        # Também cobre filtros só por setor (prefixo do índice)
+        Index("ix_materiais_setor_sala", "setor", "sala"),
+        # Índice parcial: só indexa materiais NÃO conferidos
+        # (o que o dashboard procura) - páginas de índice bem menores
+        Index(
+            "ix_materiais_nao_conferidos",
+            "conferido",
+            postgresql_where=text("conferido = false"),
+        ),
+    )
+
     # Identificação
     id = Column(Integer, primary_key=True, index=True)
     nome = Column(String(255), nullable=False, index=True)
@@ -75,11 +90,14 @@ class Material(Base):
     
     # Localização
     setor = Column(String(100), nullable=False, index=True)
+    # Índice próprio além do composto (setor, sala): filtro só por sala
+    # (GET /materiais?sala=X) não aproveita um índice liderado por setor
     sala = Column(String(100), nullable=False, index=True)
     responsavel = Column(String(255), nullable=False)
     
     # QR Code
     qr_hash = Column(String(16), unique=True, index=True)  # Hash único de 16 chars
+    qr_png = Column(LargeBinary, nullable=True)  # PNG do QR Code renderizado 1x na criação
     
     # Status de conferência
     conferido = Column(Boolean, default=False, index=True)
@@ -109,10 +127,17 @@ Por que criar índices?
 2. materiais.nome - busca por nome do material
 3. materiais.bmp - busca por código BMP
 4. materiais.setor - filtro por setor (usado frequentemente)
-5. materiais.sala - filtro por sala (usado frequentemente)
+5. materiais.sala - filtro só por sala (o composto abaixo não cobre
+   esse caso: sala não é a coluna líder dele)
 6. materiais.qr_hash - busca por QR Code (CRÍTICO para conferência mobile)
 7. materiais.conferido - filtro de materiais conferidos/não conferidos
 
+Índices declarados em __table_args__:
+8. ix_materiais_setor_sala - composto (setor, sala) para listagens
+   por local; evita index-merge entre dois índices separados
+9. ix_materiais_nao_conferidos - parcial (WHERE conferido = false),
+   só indexa o que o dashboard de pendências procura
+
 Trade-off:
 ✅ Vantagens: Queries 10-100x mais rápidas
 ❌ Desvantagens: Inserts/Updates um pouco mais lentos, mais espaço em disco
@@ -13,9 +13,120 @@ Diferença entre Models e Schemas:
 - Schemas (Pydantic): Representam DADOS que trafegam na API (JSON)
 """
 
-from pydantic import BaseModel, Field, validator
-from typing import Optional
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    ConfigDict,
+    Field,
+    PlainSerializer,
+    StringConstraints,
+    TypeAdapter,
+    field_validator,
+    model_validator,
+)
+from pydantic.dataclasses import dataclass as pydantic_dataclass
+from typing import Annotated, Any, Literal, Optional
 from datetime import datetime
+from functools import lru_cache
+import os
+import re
+
+# Descrições de campo (Swagger) são strings mantidas vivas pela vida
+# inteira do processo. SCHEMAS_DOCSTRINGS=0 permite a uma instância de
+# produção (sem /docs exposto) importar os schemas sem alocá-las.
+# Default ligado: o /docs continua completo em dev
+_DESC = os.environ.get('SCHEMAS_DOCSTRINGS', '1') != '0'
+
+def _d(s):
+    """Descrição de campo condicionada ao ambiente (None = não aloca)"""
+    return s if _DESC else None
+
+# Regex pré-compilada (módulo _sre em C): valida os 16 hex chars do
+# qr_hash em uma única chamada, em vez de iterar caractere a caractere
+# em Python a cada scan
+_HEX16_RE = re.compile(r'\A[0-9a-f]{16}\Z')
+
+# ==============================================================================
+# HELPERS DE VALIDAÇÃO (nível de módulo)
+# ==============================================================================
+# Por que fora das classes?
+# - Validators rodam 1x por campo por request: função de módulo evita
+#   o dispatch de método/classmethod a cada chamada
+# - Reutilizáveis entre schemas via os tipos Annotated abaixo
+
+@lru_cache(maxsize=1024)
+def _normalize_location(v: str) -> str:
+    """
+    Normaliza localização: remove espaços extras, capitaliza
+
+    lru_cache: na prática existem poucas dezenas de setores/salas
+    distintos, mas eles chegam milhares de vezes por dia (cada scan).
+    Repetições viram um lookup de dict em C, sem realocar a string
+    """
+    if v:
+        return v.strip().title()  # "sala 1" -> "Sala 1"
+    return v
+
+
+def _from_orm_fast(cls, obj):
+    """
+    Conversão ORM -> schema SEM validação (model_construct)
+
+    Para dados que JÁ passaram pela validação na escrita (o banco é
+    fonte confiável), revalidar na leitura é CPU jogada fora:
+    model_construct só copia os atributos, pulando validators e
+    coerção de tipos
+
+    ATENÇÃO: use apenas em caminhos de LEITURA de dados do banco.
+    Input de cliente deve SEMPRE passar por model_validate
+    """
+    return cls.model_construct(**{f: getattr(obj, f) for f in cls.model_fields})
+
+
+# ==============================================================================
+# TIPOS ANOTADOS COMPARTILHADOS
+# ==============================================================================
+# StringConstraints(strip_whitespace=True) roda DENTRO do pydantic-core
+# (Rust): o strip acontece sem callback Python, e o min_length aplicado
+# DEPOIS do strip rejeita strings só de espaços — substituindo o antigo
+# validate_not_empty. Só a capitalização de localização (title) ainda
+# precisa de um AfterValidator em Python.
+#
+# Reutilizados por MaterialBase, MaterialUpdate e ScanQRCode: um único
+# nó de core-schema por tipo (em vez de constraints duplicadas campo a
+# campo) e a garantia de que criação, edição e conferência normalizam
+# localização do MESMO jeito
+
+# Descritores de constraint construídos UMA vez e compartilhados entre
+# os aliases (nome e responsavel têm limites idênticos: um objeto só)
+_STRIP_3_255 = StringConstraints(strip_whitespace=True, min_length=3, max_length=255)
+_TITLE_CASE = AfterValidator(_normalize_location)
+
+NomeStr = Annotated[str, _STRIP_3_255]
+BmpStr = Annotated[str, StringConstraints(min_length=1, max_length=100)]
+ResponsavelStr = Annotated[str, _STRIP_3_255]
+SetorStr = Annotated[
+    str,
+    StringConstraints(strip_whitespace=True, min_length=2, max_length=100),
+    _TITLE_CASE,
+]
+SalaStr = Annotated[
+    str,
+    StringConstraints(strip_whitespace=True, min_length=1, max_length=100),
+    _TITLE_CASE,
+]
+
+# Datetime com serialização ISO-8601 em UMA chamada C (datetime.isoformat)
+# no dump JSON, em vez do caminho multi-etapas default. when_used='json'
+# preserva o objeto datetime em dump_python.
+# O lambda é obrigatório: passar datetime.isoformat (builtin em C)
+# direto quebra o import no pydantic 2.5.3 pinado, que não consegue
+# inspecionar a assinatura de métodos builtin
+IsoDatetime = Annotated[
+    datetime,
+    PlainSerializer(lambda v: v.isoformat(), return_type=str, when_used='json'),
+]
+
 
 # ==============================================================================
 # SCHEMAS DE USUÁRIO
@@ -23,12 +134,15 @@ from datetime import datetime
 
 class UserBase(BaseModel):
     """Schema base de usuário (campos comuns)"""
-    username: str = Field(..., min_length=3, max_length=50, description="Nome de usuário único")
-    role: str = Field(default="operador", description="Papel: admin ou operador")
+    username: str = Field(..., min_length=3, max_length=50, description=_d("Nome de usuário único"))
+    # Literal: pydantic-core valida por lookup O(1) num hashset Rust e
+    # rejeita papéis inválidos sem callback Python (antes qualquer
+    # string passava e a checagem ficava por conta do banco)
+    role: Literal['admin', 'operador'] = Field(default='operador', description=_d("Papel: admin ou operador"))
 
 class UserCreate(UserBase):
     """Schema para CRIAR usuário (inclui senha)"""
-    password: str = Field(..., min_length=6, description="Senha (mínimo 6 caracteres)")
+    password: str = Field(..., min_length=6, description=_d("Senha (mínimo 6 caracteres)"))
 
 class User(UserBase):
     """
@@ -38,11 +152,16 @@ class User(UserBase):
     Nunca exponha senhas (mesmo criptografadas) via API
     """
     id: int
-    created_at: datetime
-    
-    class Config:
-        # Permite conversão de ORM model para Pydantic
-        orm_mode = True
+    created_at: IsoDatetime
+
+    # Permite conversão de ORM model para Pydantic (v2: from_attributes)
+    # revalidate_instances='never' (explícito): instância já validada
+    # não é revalidada ao ser aninhada em outra resposta/lista —
+    # pinamos o comportamento para não depender do default da versão
+    model_config = ConfigDict(from_attributes=True, revalidate_instances='never')
+
+    # Leitura confiável do banco: pula a validação (ver helper)
+    from_orm_fast = classmethod(_from_orm_fast)
 
 
 # ==============================================================================
@@ -57,26 +176,12 @@ class MaterialBase(BaseModel):
     - Campos obrigatórios: nome, bmp, setor, sala, responsavel
     - Comprimento mínimo para evitar dados inválidos
     """
-    nome: str = Field(..., min_length=3, max_length=255, description="Nome do material")
-    bmp: str = Field(..., min_length=1, max_length=100, description="Código BMP")
-    setor: str = Field(..., min_length=2, max_length=100, description="Setor onde está localizado")
-    sala: str = Field(..., min_length=1, max_length=100, description="Sala onde está localizado")
-    responsavel: str = Field(..., min_length=3, max_length=255, description="Nome do responsável")
-    observacoes: Optional[str] = Field(None, description="Observações adicionais")
-    
-    @validator('nome', 'responsavel')
-    def validate_not_empty(cls, v):
-        """Validador customizado: não permite strings vazias ou só espaços"""
-        if v and not v.strip():
-            raise ValueError('Campo não pode ser vazio')
-        return v.strip() if v else v
-    
-    @validator('setor', 'sala')
-    def normalize_location(cls, v):
-        """Normaliza localização: remove espaços extras, capitaliza"""
-        if v:
-            return v.strip().title()  # "sala 1" -> "Sala 1"
-        return v
+    nome: NomeStr = Field(..., description=_d("Nome do material"))
+    bmp: BmpStr = Field(..., description=_d("Código BMP"))
+    setor: SetorStr = Field(..., description=_d("Setor onde está localizado"))
+    sala: SalaStr = Field(..., description=_d("Sala onde está localizado"))
+    responsavel: ResponsavelStr = Field(..., description=_d("Nome do responsável"))
+    observacoes: Optional[str] = Field(None, description=_d("Observações adicionais"))
 
 
 class MaterialCreate(MaterialBase):
@@ -98,19 +203,55 @@ class MaterialUpdate(BaseModel):
     
     Exemplo: Atualizar apenas o setor sem mexer em outros campos
     """
-    nome: Optional[str] = Field(None, min_length=3, max_length=255)
-    bmp: Optional[str] = Field(None, min_length=1, max_length=100)
-    setor: Optional[str] = Field(None, min_length=2, max_length=100)
-    sala: Optional[str] = Field(None, min_length=1, max_length=100)
-    responsavel: Optional[str] = Field(None, min_length=3, max_length=255)
+    # Mesmos tipos compartilhados do MaterialBase: constraints idênticas
+    # (sem duplicar nós de schema) e normalização idêntica no PATCH
+    nome: Optional[NomeStr] = None
+    bmp: Optional[BmpStr] = None
+    setor: Optional[SetorStr] = None
+    sala: Optional[SalaStr] = None
+    responsavel: Optional[ResponsavelStr] = None
     observacoes: Optional[str] = None
     
-    @validator('*', pre=True)
-    def empty_str_to_none(cls, v):
-        """Converte strings vazias para None"""
-        if v == '':
-            return None
-        return v
+    @model_validator(mode='before')
+    @classmethod
+    def empty_str_to_none(cls, data):
+        """
+        Converte strings vazias para None
+
+        model_validator(before) varre o dict de entrada UMA vez: 1
+        chamada Python por PATCH, em vez do antigo wildcard
+        @validator('*') que custava 1 chamada por campo
+
+        Fast path: o caso comum (PATCH só com valores reais) devolve o
+        dict original sem alocar um novo — só reconstruímos quando há
+        de fato alguma string vazia para converter
+        """
+        if isinstance(data, dict):
+            for v in data.values():
+                if v == '':
+                    return {k: (None if v == '' else v) for k, v in data.items()}
+        return data
+
+
+class MaterialListItem(BaseModel):
+    """
+    Schema ENXUTO para listagens de materiais
+
+    Listagens retornam muitas linhas: carregar e serializar só as
+    colunas que a tela de lista usa (sem observacoes/Text, sem
+    timestamps, sem qr_png) reduz bytes vindos do banco e o custo
+    de construção de cada linha. Para o item completo, use Material
+    (endpoint de detalhe)
+    """
+    id: int
+    nome: str
+    bmp: str
+    setor: str
+    sala: str
+    responsavel: str
+    conferido: bool = False
+
+    model_config = ConfigDict(from_attributes=True, revalidate_instances='never')
 
 
 class Material(MaterialBase):
@@ -124,14 +265,17 @@ class Material(MaterialBase):
     - timestamps: Datas de criação/atualização
     """
     id: int
-    qr_hash: Optional[str] = Field(None, description="Hash único do QR Code")
-    conferido: bool = Field(default=False, description="Se foi conferido")
-    ultima_conferencia: Optional[datetime] = Field(None, description="Data da última conferência")
-    created_at: datetime = Field(..., description="Data de criação")
-    updated_at: Optional[datetime] = Field(None, description="Data de atualização")
-    
-    class Config:
-        orm_mode = True  # Permite conversão de SQLAlchemy model
+    qr_hash: Optional[str] = Field(None, description=_d("Hash único do QR Code"))
+    conferido: bool = Field(default=False, description=_d("Se foi conferido"))
+    ultima_conferencia: Optional[IsoDatetime] = Field(None, description=_d("Data da última conferência"))
+    created_at: IsoDatetime = Field(..., description=_d("Data de criação"))
+    updated_at: Optional[IsoDatetime] = Field(None, description=_d("Data de atualização"))
+
+    # Permite conversão de SQLAlchemy model; sem revalidação ao aninhar
+    model_config = ConfigDict(from_attributes=True, revalidate_instances='never')
+
+    # Leitura confiável do banco: pula a validação (ver helper)
+    from_orm_fast = classmethod(_from_orm_fast)
 
 
 # ==============================================================================
@@ -148,43 +292,59 @@ class ScanQRCode(BaseModel):
     3. Envia para API: qr_hash + setor + sala
     4. API atualiza localização do material
     """
-    qr_hash: str = Field(..., min_length=16, max_length=16, description="Hash do QR Code lido")
-    setor: str = Field(..., min_length=2, max_length=100, description="Setor da conferência")
-    sala: str = Field(..., min_length=1, max_length=100, description="Sala da conferência")
+    qr_hash: str = Field(..., min_length=16, max_length=16, description=_d("Hash do QR Code lido"))
+    # Tipos compartilhados: a conferência grava setor/sala com a MESMA
+    # normalização da criação (antes o scan gravava o valor cru, e o
+    # mesmo setor podia existir com duas grafias diferentes)
+    setor: SetorStr = Field(..., description=_d("Setor da conferência"))
+    sala: SalaStr = Field(..., description=_d("Sala da conferência"))
     
-    @validator('qr_hash')
-    def validate_hash_format(cls, v):
+    @field_validator('qr_hash')
+    @classmethod
+    def validate_hash_format(cls, v: str) -> str:
         """Valida formato do hash (16 caracteres hexadecimais)"""
-        if not all(c in '0123456789abcdef' for c in v.lower()):
+        v = v.lower()
+        if _HEX16_RE.match(v) is None:
             raise ValueError('Hash deve conter apenas caracteres hexadecimais')
-        return v.lower()
+        return v
 
 
 # ==============================================================================
 # SCHEMAS DE RESPOSTA
 # ==============================================================================
 
-class MessageResponse(BaseModel):
+# Por que dataclass(slots=True, frozen=True) aqui?
+# Estes dois schemas são puros objetos de VALOR de resposta (nunca
+# construídos a partir do ORM): slots elimina o __dict__ por instância
+# (~metade da memória, menos pressão de GC) e frozen documenta que a
+# resposta não é mutada depois de montada
+
+@pydantic_dataclass(slots=True, frozen=True)
+class MessageResponse:
     """Schema genérico para respostas de sucesso"""
     message: str
-    detail: Optional[dict] = None
+    # dict[str, Any] (e não dict nu): chaves validadas como str pelo
+    # validador especializado do pydantic-core, sem o walk recursivo
+    # genérico que o dict sem parâmetros dispara
+    detail: Optional[dict[str, Any]] = None
 
 
-class DashboardStats(BaseModel):
+@pydantic_dataclass(slots=True, frozen=True)
+class DashboardStats:
     """
     Schema para estatísticas do dashboard
-    
+
     Métricas importantes para gestão:
     - Total de materiais cadastrados
     - Quantos foram conferidos
     - Taxa de conferência (%)
     - Número de setores
     """
-    total_materiais: int = Field(..., description="Total de materiais cadastrados")
-    materiais_conferidos: int = Field(..., description="Materiais já conferidos")
-    materiais_nao_conferidos: int = Field(..., description="Materiais não conferidos")
-    total_setores: int = Field(..., description="Número de setores únicos")
-    taxa_conferencia: float = Field(..., description="Taxa de conferência (%)")
+    total_materiais: int = Field(..., description=_d("Total de materiais cadastrados"))
+    materiais_conferidos: int = Field(..., description=_d("Materiais já conferidos"))
+    materiais_nao_conferidos: int = Field(..., description=_d("Materiais não conferidos"))
+    total_setores: int = Field(..., description=_d("Número de setores únicos"))
+    taxa_conferencia: float = Field(..., description=_d("Taxa de conferência (%)"))
 
 
 # ==============================================================================
@@ -204,9 +364,41 @@ class MaterialExport(BaseModel):
     responsavel: str
     qr_hash: str
     conferido: bool
-    
-    class Config:
-        orm_mode = True
+
+    model_config = ConfigDict(from_attributes=True, revalidate_instances='never')
+
+
+# ==============================================================================
+# PRÉ-COMPILAÇÃO DOS SCHEMAS (warm-up no boot)
+# ==============================================================================
+# Força a construção do SchemaValidator/SchemaSerializer de TODOS os
+# modelos no import do módulo. Sem isso a compilação é lazy e o custo
+# cai no PRIMEIRO request que usa cada schema — exatamente onde latência
+# de P99 mais dói. Pagar no boot do processo é grátis para o usuário
+
+for _m in (UserBase, UserCreate, User,
+           MaterialBase, MaterialCreate, MaterialUpdate,
+           MaterialListItem, Material, ScanQRCode, MaterialExport):
+    _m.model_rebuild(force=True)
+del _m
+# (MessageResponse/DashboardStats são dataclasses pydantic: o schema
+# delas já é construído no próprio decorator)
+
+
+# ==============================================================================
+# ADAPTERS DE LISTA (serialização em lote)
+# ==============================================================================
+# TypeAdapter construído UMA vez no import. Nas rotas de listagem,
+# validar/serializar a lista inteira em uma chamada deixa o loop por
+# item dentro do pydantic-core (Rust), em vez de um for em Python com
+# um dispatch de model_validate por linha
+
+MATERIAL_LIST_ADAPTER = TypeAdapter(list[MaterialListItem])
+MATERIAL_EXPORT_LIST_ADAPTER = TypeAdapter(list[MaterialExport])
+
+# DashboardStats virou dataclass (sem model_dump_json próprio):
+# serialização sai por este adapter
+STATS_ADAPTER = TypeAdapter(DashboardStats)
 
 
 # ==============================================================================